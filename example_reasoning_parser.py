@@ -52,10 +52,12 @@ class DeepSeekR1ReasoningParser(ReasoningParser):
         """
         Extract the content after the end tokens
         """
-        if self.end_token_id not in input_ids[:-1]:
+        # Single bounded scan; the end token in the last slot yields no content
+        try:
+            end_index = input_ids.index(self.end_token_id, 0, len(input_ids) - 1)
+        except ValueError:
             return []
-        else:
-            return input_ids[input_ids.index(self.end_token_id) + 1 :]
+        return input_ids[end_index + 1 :]
 
     def _remove_leading_newlines(self, content: str) -> str:
         """Remove exactly two leading newlines if present"""
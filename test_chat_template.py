@@ -1,38 +1,87 @@
+import functools
+import json
+from pathlib import Path
+
 import pytest
 from jinja2 import Template
 
+TEMPLATE_PATH = Path(__file__).parent / "example-chat-template.txt"
+
 
-# Load the chat template once for all tests
-@pytest.fixture(scope="module")
+# Read and parse the chat template once per test session
+@pytest.fixture(scope="session")
 def chat_template():
-    with open("example-chat-template.txt") as f:
-        return Template(f.read())
+    return Template(TEMPLATE_PATH.read_text())
+
+
+@functools.lru_cache(maxsize=64)
+def _render_cached(template, messages_key, tools_key):
+    return template.render(
+        bos_token="<|begin_of_text|>",
+        add_generation_prompt=True,
+        tools=json.loads(tools_key),
+        tools_in_user_message=True,
+        messages=json.loads(messages_key),
+    ).encode()
+
+
+def render(template, messages, tools=None):
+    """Render a conversation to UTF-8 bytes, reusing the output for identical inputs"""
+    return _render_cached(
+        template,
+        json.dumps(messages, sort_keys=True),
+        json.dumps(tools, sort_keys=True),
+    )
+
+
+HEADER_START = b"<|start_header_id|>"
+HEADER_END = b"<|end_header_id|>"
+EOT = b"<|eot_id|>"
+
+PREFIX = b"detailed thinking on"
+NEEDLE_FRANCE = b"detailed thinking on What is the capital of France?"
+NEEDLE_WEATHER = b"detailed thinking on What is the weather in Paris?"
+NEEDLE_USER = b"detailed thinking on User message"
+
+
+def sections(text):
+    """Split rendered conversation bytes into {role: [section, ...]} in one pass"""
+    out = {}
+    i = 0
+    while True:
+        a = text.find(HEADER_START, i)
+        if a < 0:
+            break
+        b = text.find(HEADER_END, a)
+        role = text[a + len(HEADER_START) : b].decode()
+        start = b + len(HEADER_END)
+        c = text.find(EOT, start)
+        if c < 0:
+            out.setdefault(role, []).append(text[start:])
+            break
+        out.setdefault(role, []).append(text[start:c])
+        i = c + len(EOT)
+    return out
 
 
 # Test cases
 def test_simple_user_message(chat_template):
     """Test that simple user messages get 'detailed thinking on' prefix"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
+    result = render(
+        chat_template,
         messages=[{"role": "user", "content": "What is the capital of France?"}],
     )
-
-    # Should contain the prefix before user message
-    assert "detailed thinking on What is the capital of France?" in result
+    secs = sections(result)
 
     # Extract user message section
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on What is the capital of France?" in user_section
+    user_section = secs["user"][0]
+    assert NEEDLE_FRANCE in user_section
 
 
 def test_multi_content_user_message(chat_template):
     """Test that multi-content user messages get prefix on text content"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
+    result = render(
+        chat_template,
         messages=[
             {
                 "role": "user",
@@ -46,261 +95,178 @@ def test_multi_content_user_message(chat_template):
             }
         ],
     )
-
-    # Should contain prefix before text content
-    assert "detailed thinking on What is the capital of France?" in result
+    secs = sections(result)
 
     # Extract user message section
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on What is the capital of France?" in user_section
+    user_section = secs["user"][0]
+    assert NEEDLE_FRANCE in user_section
 
 
 def test_system_message_first(chat_template):
     """Test that system messages are preserved and user messages get prefix"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
+    result = render(
+        chat_template,
         messages=[
             {"role": "system", "content": "You are a geography expert"},
             {"role": "user", "content": "What is the capital of France?"},
         ],
     )
-
-    # System message should be preserved
-    assert "You are a geography expert" in result
+    secs = sections(result)
 
     # Extract system message section
-    system_section = result.split("<|start_header_id|>system<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
-    assert "You are a geography expert" in system_section
+    system_section = secs["system"][0]
+    assert b"You are a geography expert" in system_section
 
     # Extract user message section
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on What is the capital of France?" in user_section
+    user_section = secs["user"][0]
+    assert NEEDLE_FRANCE in user_section
 
 
 def test_assistant_message_no_prefix(chat_template):
     """Test that assistant messages don't get the prefix"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
+    result = render(
+        chat_template,
         messages=[
             {"role": "user", "content": "What is the capital of France?"},
             {"role": "assistant", "content": "The capital of France is Paris."},
         ],
     )
+    secs = sections(result)
 
     # Extract user message section
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on What is the capital of France?" in user_section
+    user_section = secs["user"][0]
+    assert NEEDLE_FRANCE in user_section
 
     # Extract assistant message section
-    assistant_section = result.split("<|start_header_id|>assistant<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
-    assert "The capital of France is Paris." in assistant_section
-    assert "detailed thinking on" not in assistant_section
-
-
-def test_non_user_messages_no_prefix(chat_template):
+    assistant_section = secs["assistant"][0]
+    assert b"The capital of France is Paris." in assistant_section
+    assert PREFIX not in assistant_section
+
+
+NON_USER_MESSAGES = [
+    {"role": "system", "content": "System message"},
+    {"role": "assistant", "content": "Assistant message"},
+    {"role": "tool", "content": "Tool message"},
+    {"role": "user", "content": "User message"},
+]
+
+
+@pytest.mark.parametrize(
+    "role, needle, prefixed",
+    [
+        ("system", b"System message", False),
+        ("assistant", b"Assistant message", False),
+        ("ipython", b"Tool message", False),
+        ("user", NEEDLE_USER, True),
+    ],
+)
+def test_non_user_messages_no_prefix(chat_template, role, needle, prefixed):
     """Test that system/assistant/tool messages don't get prefix"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
-        messages=[
-            {"role": "system", "content": "System message"},
-            {"role": "assistant", "content": "Assistant message"},
-            {"role": "tool", "content": "Tool message"},
-            {"role": "user", "content": "User message"},
-        ],
-    )
+    result = render(chat_template, NON_USER_MESSAGES)
+    section = sections(result)[role][0]
 
-    # Extract system message section
-    system_section = result.split("<|start_header_id|>system<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
-    assert "System message" in system_section
-    assert "detailed thinking on" not in system_section
-
-    # Extract assistant message section
-    assistant_section = result.split("<|start_header_id|>assistant<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
-    assert "Assistant message" in assistant_section
-    assert "detailed thinking on" not in assistant_section
-
-    # Extract tool message section
-    tool_section = result.split("<|start_header_id|>ipython<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "Tool message" in tool_section
-    assert "detailed thinking on" not in tool_section
-
-    # Extract user message section
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on User message" in user_section
+    assert needle in section
+    assert (PREFIX in section) == prefixed
 
 
 # Tool-related tests
-def test_single_tool_call(chat_template):
-    """Test formatting of assistant tool calls"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
-        messages=[
+FULL_CONVO = [
+    {"role": "user", "content": "What is the weather in Paris?"},
+    {
+        "role": "assistant",
+        "tool_calls": [
             {
-                "role": "assistant",
-                "tool_calls": [
-                    {
-                        "id": "call_abc123",
-                        "function": {
-                            "name": "get_weather",
-                            "arguments": '{"location": "Paris", "unit": "celsius"}',
-                        },
-                    }
-                ],
+                "id": "call_abc123",
+                "function": {
+                    "name": "get_weather",
+                    "arguments": '{"location": "Paris", "unit": "celsius"}',
+                },
             }
         ],
-    )
+    },
+    {
+        "role": "tool",
+        "tool_call_id": "call_abc123",
+        "name": "get_weather",
+        "content": "Sunny, 22°C",
+    },
+    {
+        "role": "tool",
+        "tool_call_id": "call_abc123",
+        "name": "get_weather",
+        "content": [
+            {"type": "text", "text": "Sunny, 22°C"},
+            {
+                "type": "image",
+                "image_url": {"url": "https://example.com/weather.png"},
+            },
+        ],
+    },
+    {"role": "assistant", "content": "The weather in Paris is sunny and 22°C."},
+]
 
-    # Extract assistant tool call section
-    tool_call_section = result.split("<|start_header_id|>assistant<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
+
+# Render the full tool conversation once and share its sections
+@pytest.fixture(scope="session")
+def full_tool_render(chat_template):
+    return sections(render(chat_template, FULL_CONVO))
+
+
+def test_single_tool_call(full_tool_render):
+    """Test formatting of assistant tool calls"""
+    tool_call_section = full_tool_render["assistant"][0]
 
     # Should contain proper JSON structure
     assert (
-        '{"name": "get_weather", "parameters": {"location": "Paris", "unit": "celsius"}}'
+        b'{"name": "get_weather", "parameters": {"location": "Paris", "unit": "celsius"}}'
         in tool_call_section
     )
-    assert "detailed thinking on" not in tool_call_section
+    assert PREFIX not in tool_call_section
 
 
-def test_tool_response(chat_template):
+def test_tool_response(full_tool_render):
     """Test formatting of tool responses"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
-        messages=[
-            {
-                "role": "tool",
-                "tool_call_id": "call_abc123",
-                "name": "get_weather",
-                "content": "Sunny, 22°C",
-            }
-        ],
-    )
-
-    # Extract tool response section
-    tool_response_section = result.split("<|start_header_id|>ipython<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
+    tool_response_section = full_tool_render["ipython"][0]
 
     # Should contain proper JSON output
     # Degree symbol might be escaped as \u00b0 in JSON
-    assert "Sunny, 22" in tool_response_section and "C" in tool_response_section
-    assert "output" in tool_response_section
-    assert "detailed thinking on" not in tool_response_section
+    assert b"Sunny, 22" in tool_response_section and b"C" in tool_response_section
+    assert b"output" in tool_response_section
+    assert PREFIX not in tool_response_section
 
 
-def test_multi_tool_response(chat_template):
+def test_multi_tool_response(full_tool_render):
     """Test formatting of tool responses with multi-content"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
-        messages=[
-            {
-                "role": "tool",
-                "tool_call_id": "call_abc123",
-                "name": "get_weather",
-                "content": [
-                    {"type": "text", "text": "Sunny, 22°C"},
-                    {
-                        "type": "image",
-                        "image_url": {"url": "https://example.com/weather.png"},
-                    },
-                ],
-            }
-        ],
-    )
-
-    # Extract tool response section
-    tool_response_section = result.split("<|start_header_id|>ipython<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
+    tool_response_section = full_tool_render["ipython"][1]
 
     # Should contain only text content in JSON output
     # Degree symbol might be escaped as \u00b0 in JSON
-    assert "Sunny, 22" in tool_response_section and "C" in tool_response_section
-    assert "image" not in tool_response_section
+    assert b"Sunny, 22" in tool_response_section and b"C" in tool_response_section
+    assert b"image" not in tool_response_section
 
 
-def test_full_tool_conversation(chat_template):
+def test_full_tool_conversation(full_tool_render):
     """Test full conversation with tool use"""
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
-        messages=[
-            {"role": "user", "content": "What is the weather in Paris?"},
-            {
-                "role": "assistant",
-                "tool_calls": [
-                    {
-                        "id": "call_abc123",
-                        "function": {
-                            "name": "get_weather",
-                            "arguments": '{"location": "Paris"}',
-                        },
-                    }
-                ],
-            },
-            {
-                "role": "tool",
-                "tool_call_id": "call_abc123",
-                "name": "get_weather",
-                "content": "Sunny, 22°C",
-            },
-            {"role": "assistant", "content": "The weather in Paris is sunny and 22°C."},
-        ],
-    )
-
     # Verify user message
-    user_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "detailed thinking on What is the weather in Paris?" in user_section
+    user_section = full_tool_render["user"][0]
+    assert NEEDLE_WEATHER in user_section
 
     # Verify tool call
-    tool_call_section = result.split("<|start_header_id|>assistant<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
+    tool_call_section = full_tool_render["assistant"][0]
     assert (
-        '{"name": "get_weather", "parameters": {"location": "Paris"}}'
+        b'{"name": "get_weather", "parameters": {"location": "Paris", "unit": "celsius"}}'
         in tool_call_section
     )
 
     # Verify tool response
-    tool_response_section = result.split("<|start_header_id|>ipython<|end_header_id|>")[
-        1
-    ].split("<|eot_id|>")[0]
+    tool_response_section = full_tool_render["ipython"][0]
     # Degree symbol might be escaped as \u00b0 in JSON
-    assert "Sunny, 22" in tool_response_section and "C" in tool_response_section
+    assert b"Sunny, 22" in tool_response_section and b"C" in tool_response_section
 
     # Verify final assistant response
-    final_assistant_section = result.split(
-        "<|start_header_id|>assistant<|end_header_id|>"
-    )[2].split("<|eot_id|>")[0]
-    assert "The weather in Paris is sunny and 22°C." in final_assistant_section
-    assert "detailed thinking on" not in final_assistant_section
+    final_assistant_section = full_tool_render["assistant"][1]
+    assert "The weather in Paris is sunny and 22°C.".encode() in final_assistant_section
+    assert PREFIX not in final_assistant_section
 
 
 def test_tool_in_user_message(chat_template):
@@ -319,20 +285,17 @@ def test_tool_in_user_message(chat_template):
         }
     ]
 
-    result = chat_template.render(
-        bos_token="<|begin_of_text|>",
-        add_generation_prompt=True,
+    result = render(
+        chat_template,
         tools=tools,
-        tools_in_user_message=True,
         messages=[{"role": "user", "content": "What is the weather in Paris?"}],
     )
+    secs = sections(result)
 
     # Verify tools section
-    tools_section = result.split("<|start_header_id|>user<|end_header_id|>")[1].split(
-        "<|eot_id|>"
-    )[0]
-    assert "Given the following functions" in tools_section
-    assert "get_weather" in tools_section
+    tools_section = secs["user"][0]
+    assert b"Given the following functions" in tools_section
+    assert b"get_weather" in tools_section
 
     # Verify user message has prefix
-    assert "detailed thinking on What is the weather in Paris?" in tools_section
+    assert NEEDLE_WEATHER in tools_section
@@ -9,6 +9,7 @@ class MockTokenizer(PreTrainedTokenizerBase):
     def __init__(self):
         super().__init__()
         self.vocab: Dict[str, int] = {"<think>": 1000, "</think>": 1001}
+        self._id2tok: Dict[int, str] = {v: k for k, v in self.vocab.items()}
         self.model_tokenizer = self
 
     def __len__(self) -> int:
@@ -25,16 +26,14 @@ class MockTokenizer(PreTrainedTokenizerBase):
         return [self._convert_id_to_token(id) for id in ids]
 
     def _convert_id_to_token(self, id: int) -> str:
-        for token, token_id in self.vocab.items():
-            if token_id == id:
-                return token
-        return "[UNK]"
+        return self._id2tok.get(id, "[UNK]")
 
     def get_vocab(self) -> Dict[str, int]:
         return self.vocab
 
 
-@pytest.fixture
+# The parser keeps no per-request state, so one instance serves every test
+@pytest.fixture(scope="session")
 def parser():
     tokenizer = MockTokenizer()
     return DeepSeekR1ReasoningParser(tokenizer)
@@ -1,3 +1,4 @@
+import os
 import unittest
 from unittest.mock import MagicMock
 from vllm.entrypoints.openai.protocol import ChatCompletionRequest
@@ -5,15 +6,22 @@ from tool_plugin import Llama33ToolParser
 
 
 class TestLlama33ToolParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Minimal request object, shared since the parser never mutates it
+        cls.request = ChatCompletionRequest(
+            model="test-model", messages=[], temperature=0.7, max_tokens=100
+        )
+
     def setUp(self):
         # Mock tokenizer
         self.mock_tokenizer = MagicMock()
         self.parser = Llama33ToolParser(self.mock_tokenizer)
+        # Parse results are cached per class; start each test from a clean slate
+        Llama33ToolParser._result_cache.clear()
 
-        # Minimal request object
-        self.request = ChatCompletionRequest(
-            model="test-model", messages=[], temperature=0.7, max_tokens=100
-        )
+    def tearDown(self):
+        Llama33ToolParser._result_cache.clear()
 
     def test_valid_json_block(self):
         output = """Here's my response:
@@ -269,6 +277,224 @@ And some text after the tool calls."""
         self.assertIn('"param": "plain1"', result.tool_calls[0].function.arguments)
         self.assertEqual(result.content.strip(), "First tool call:")
 
+    def test_deeply_nested_arguments(self):
+        """Test JSON nested deeper than a fixed-depth pattern could match"""
+        output = 'Calling: {"name": "deep_tool", "arguments": {"a": {"b": {"c": 1}}}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "deep_tool")
+        self.assertIn('"c": 1', result.tool_calls[0].function.arguments)
+        self.assertEqual(result.content, "Calling:")
+
+    def test_braces_inside_strings(self):
+        """Test braces inside string values don't break object matching"""
+        output = 'Sure: {"name": "echo", "arguments": {"text": "use } and { freely"}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "echo")
+        self.assertIn("use } and { freely", result.tool_calls[0].function.arguments)
+
+    def test_unclosed_brace_before_tool_call(self):
+        """Test a stray opening brace in prose doesn't hide a later tool call"""
+        output = 'Set {x to 1, then: {"name": "set_x", "arguments": {"x": 1}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "set_x")
+        self.assertEqual(result.content, "Set {x to 1, then:")
+
+    def test_stray_quote_in_unclosed_brace(self):
+        """Test a quote inside an unclosed prose brace doesn't swallow the call"""
+        output = 'Use {x" here then {"name": "f", "arguments": {}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "f")
+        self.assertEqual(result.content, 'Use {x" here then')
+
+    def test_many_unclosed_braces_before_tool_call(self):
+        """Test a run of unclosed braces is scanned once, not once per brace"""
+        output = "{" * 5000 + '{"name": "set_x", "arguments": {"x": 1}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "set_x")
+
+    def test_single_quoted_json(self):
+        """Test single-quoted JSON is converted to valid JSON"""
+        output = """```json
+{'name': 'sq_tool', 'arguments': {'city': 'Paris', 'tags': ['sunny']}}
+```"""
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "sq_tool")
+        self.assertIn('"city": "Paris"', result.tool_calls[0].function.arguments)
+
+    def test_single_quoted_array_items(self):
+        """Test every item of a single-quoted array is converted"""
+        output = """```json
+{'name': 'sq_tool', 'arguments': {'tags': ['sunny', 'warm']}}
+```"""
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(
+            result.tool_calls[0].function.arguments, '{"tags": ["sunny", "warm"]}'
+        )
+
+    def test_apostrophes_in_double_quoted_json(self):
+        """Test quotes inside valid JSON strings are not treated as single-quoted JSON"""
+        output = """```json
+{"name": "say", "arguments": {"text": "don't 'quote': me"}}
+```"""
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(
+            result.tool_calls[0].function.arguments, '{"text": "don\'t \'quote\': me"}'
+        )
+
+    def test_comment_markers_inside_strings(self):
+        """Test // inside string values is kept while real comments are dropped"""
+        output = """```json
+{
+    "name": "fetch", // the tool
+    "arguments": {
+        "url": "http://example.com", // trailing comma below
+    }
+}
+```"""
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "fetch")
+        self.assertIn("http://example.com", result.tool_calls[0].function.arguments)
+
+    def test_arguments_keep_source_text(self):
+        """Test object arguments are passed through as written, not re-serialized"""
+        output = '{"name": "weather", "arguments": {"city": "Zürich", "days": [1, 2]}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(
+            result.tool_calls[0].function.arguments,
+            '{"city": "Zürich", "days": [1, 2]}',
+        )
+
+    def test_repaired_inline_json(self):
+        """Test inline JSON that only parses after cleanup is still used"""
+        output = r'Call {"name": "say", "arguments": {"text": "a \"}\" b",},} now'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "say")
+        self.assertEqual(result.content, "Call")
+
+    def test_repeated_output_gets_fresh_ids(self):
+        """Test cached parses still produce a new tool call id per call"""
+        output = '{"name": "cached_tool", "arguments": {"n": 1}}'
+        first = self.parser.extract_tool_calls(output, self.request)
+        second = Llama33ToolParser(self.mock_tokenizer).extract_tool_calls(
+            output, self.request
+        )
+        self.assertEqual(first.tool_calls[0].function, second.tool_calls[0].function)
+        self.assertNotEqual(first.tool_calls[0].id, second.tool_calls[0].id)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_process_gets_distinct_ids(self):
+        """Test a process forked after import doesn't repeat the parent's ids"""
+        output = '{"name": "fork_tool", "arguments": {}}'
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                result = self.parser.extract_tool_calls(output, self.request)
+                os.write(write_fd, result.tool_calls[0].id.encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd) as pipe:
+            child_id = pipe.read()
+        parent_id = (
+            self.parser.extract_tool_calls(output, self.request).tool_calls[0].id
+        )
+        self.assertNotEqual(child_id, parent_id)
+
+    def test_subclass_does_not_share_cached_results(self):
+        """Test the result cache keeps a subclass's parses apart from the base"""
+
+        class NoToolsParser(Llama33ToolParser):
+            def _parse_json_tool_call(self, json_str):
+                return None
+
+        output = '{"name": "shared_tool", "arguments": {}}'
+        self.assertTrue(
+            self.parser.extract_tool_calls(output, self.request).tools_called
+        )
+        result = NoToolsParser(self.mock_tokenizer).extract_tool_calls(
+            output, self.request
+        )
+        self.assertFalse(result.tools_called)
+
+    def test_unrelated_json_before_tool_call(self):
+        """Test JSON objects without tool call keys are skipped"""
+        output = (
+            'Config is {"retries": 3, "opts": {"name": "x"}} so calling '
+            '{"name": "retry_tool", "arguments": {"retries": 3}}'
+        )
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "retry_tool")
+        self.assertEqual(
+            result.content, 'Config is {"retries": 3, "opts": {"name": "x"}} so calling'
+        )
+
+    def test_non_standard_numbers_accepted_everywhere(self):
+        """Test inline and fenced tool calls accept the same JSON, orjson or not"""
+        payloads = [
+            '{"name": "f", "arguments": {"x": NaN}}',
+            '{"name": "f", "arguments": {"x": 1e400}}',
+            '{"name": "f", "arguments": {"x": "\\ud800"}}',
+        ]
+        for payload in payloads:
+            for output in (payload, f"```json\n{payload}\n```"):
+                with self.subTest(output=output):
+                    result = self.parser.extract_tool_calls(output, self.request)
+                    self.assertTrue(result.tools_called)
+
+    def test_json_candidate_budget(self):
+        """Test the free-form JSON search stops after max_json_candidates decodes"""
+        self.parser.max_json_candidates = 3
+        decoy = '{"name": "", "arguments": {}}'
+        output = " ".join([decoy] * 3) + ' then {"name": "late_tool", "arguments": {}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertFalse(result.tools_called)
+
+        # A parser with the default budget must not reuse that cached miss
+        result = Llama33ToolParser(self.mock_tokenizer).extract_tool_calls(
+            output, self.request
+        )
+        self.assertTrue(result.tools_called)
+
+    def test_unrelated_objects_do_not_use_candidate_budget(self):
+        """Test objects rejected by the key prefilter don't count against the cap"""
+        count = Llama33ToolParser.max_json_candidates + 6
+        output = " ".join(["{}"] * count) + ' {"name": "f", "arguments": {}}'
+        result = self.parser.extract_tool_calls(output, self.request)
+        self.assertTrue(result.tools_called)
+        self.assertEqual(result.tool_calls[0].function.name, "f")
+
+    def test_special_tokens_and_markdown_order(self):
+        """Test the earliest call wins across special-token and markdown forms"""
+        special = (
+            '<|tool_call|>{"name": "special_tool", "arguments": {}}<|tool_call_end|>'
+        )
+        markdown = '```json\n{"name": "markdown_tool", "arguments": {}}\n```'
+        cases = [
+            (f"A {special} B {markdown}", "special_tool"),
+            (f"A {markdown} B {special}", "markdown_tool"),
+        ]
+
+        for output, expected in cases:
+            with self.subTest(expected=expected):
+                result = self.parser.extract_tool_calls(output, self.request)
+                self.assertTrue(result.tools_called)
+                self.assertEqual(result.tool_calls[0].function.name, expected)
+                self.assertEqual(result.content, "A")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -3,11 +3,15 @@
 
 import re
 import json
-import random
-import string
-from typing import List, Dict, Any, Optional, Union, Sequence
+import functools
+import itertools
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from json.decoder import scanstring
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Sequence
 
-from vllm.entrypoints.chat_utils import random_tool_call_id
 from vllm.entrypoints.openai.protocol import (
     ChatCompletionRequest,
     ToolCall,
@@ -22,6 +26,298 @@ from vllm.logger import init_logger
 
 logger = init_logger(__name__)
 
+try:
+    # orjson is optional; it parses whole documents several times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(text: str) -> Any:
+    """
+    json.loads, through orjson when it is installed. orjson is stricter than
+    the stdlib (NaN, out-of-range numbers, lone surrogates), so anything it
+    rejects is retried with json.loads to accept exactly what the stdlib does.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+# Patterns used on every parse are compiled once at import time
+_JSON_BLOCK_RE = re.compile(r"```(?:json)?\s*\n(.*?)\n```", re.DOTALL)
+# A single-quoted key, value or array item, up to the delimiter after it
+_SQ_STRING_RE = re.compile(r"'([^']*)'(\s*[:,\]}])")
+
+_DECODER = json.JSONDecoder()
+_JSON_WS_RE = re.compile(r"[ \t\n\r]*")
+_OBJECT_TOKEN_RE = re.compile(r'[{}"\\]')
+# Extra passes _iter_object_spans may make after a stray quote
+_MAX_SPAN_RESCANS = 4
+_CLEAN_TOKEN_RE = re.compile(r'["\\/,]')
+
+# Tool call ids are a random per-process prefix plus a counter, which keeps
+# them unique without drawing from the OS random source on every call
+_ID_PREFIX = ""
+_ID_COUNTER = itertools.count()
+
+
+def _reseed_call_ids() -> None:
+    """Draws a new id prefix and restarts the counter"""
+    global _ID_PREFIX, _ID_COUNTER
+    _ID_PREFIX = secrets.token_hex(4)
+    _ID_COUNTER = itertools.count()
+
+
+_reseed_call_ids()
+# Workers forked after import would otherwise repeat the parent's ids
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_call_ids)
+
+
+def _next_call_id() -> str:
+    return f"call_{_ID_PREFIX}{next(_ID_COUNTER):x}"
+
+
+def _iter_object_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (start, end) for each outermost brace-balanced object in text, in a
+    forward pass. Braces inside string literals are ignored. Objects directly
+    inside a brace that never closes are yielded once the end of the text
+    shows it is unclosed.
+
+    A stray quote inside an unclosed brace can misalign the string state for
+    the rest of the text, so when a pass ends with braces left open, the text
+    after the outermost one is scanned again from a clean state. That happens
+    at most _MAX_SPAN_RESCANS times, which keeps the cost linear.
+    """
+    search = _OBJECT_TOKEN_RE.search
+    pos = 0
+    rescans = 0
+    while True:
+        stack: List[int] = []  # Positions of the currently open braces
+        pending: List[Tuple[int, int, int]] = []  # Closed spans, open parent
+        in_string = False
+        while True:
+            if stack:
+                # Jump between structural characters instead of stepping through
+                match = search(text, pos)
+                if match is None:
+                    break
+                pos = match.start()
+            else:
+                # Quotes and stray braces outside any object are just prose
+                pos = text.find("{", pos)
+                if pos == -1:
+                    break
+            ch = text[pos]
+            pos += 1
+            if in_string:
+                if ch == "\\":
+                    pos += 1  # Skip the escaped character
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                stack.append(pos - 1)
+            elif ch == "}":
+                start = stack.pop()
+                if stack:
+                    pending.append((start, pos, stack[-1]))
+                else:
+                    # Spans inside this object are no longer candidates
+                    pending.clear()
+                    yield start, pos
+
+        if stack and rescans < _MAX_SPAN_RESCANS:
+            # A stray quote inside the unclosed brace may have misaligned the
+            # string state from there on, so start over just after it
+            rescans += 1
+            pos = stack[0] + 1
+            continue
+
+        # Whatever is left open never closed, so the spans directly inside it
+        # count
+        unclosed = set(stack)
+        yield from sorted(
+            (start, end) for start, end, parent in pending if parent in unclosed
+        )
+        return
+
+
+def _skip_json_gap(text: str, pos: int) -> int:
+    """Skips whitespace and // line comments starting at pos"""
+    n = len(text)
+    while pos < n:
+        if text[pos] in " \t\r\n":
+            pos += 1
+        elif text.startswith("//", pos):
+            newline = text.find("\n", pos)
+            pos = n if newline == -1 else newline + 1
+        else:
+            break
+    return pos
+
+
+def _clean_json(text: str) -> str:
+    """
+    Strips surrounding code fences, // line comments and trailing commas in a
+    single pass. String literals are copied through untouched.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text[7:] if text[3:7].lower() == "json" else text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+
+    # Nothing to strip besides the fences; the common case for model output
+    if "//" not in text and "," not in text:
+        return text
+
+    # Jump between quotes, escapes, slashes and commas; copy the rest in chunks
+    chunks = []
+    last = 0
+    n = len(text)
+    in_string = False
+    search = _CLEAN_TOKEN_RE.search
+    match = search(text)
+    while match:
+        ch = match.group()
+        i = match.start()
+        resume = match.end()
+        if in_string:
+            if ch == "\\":
+                resume += 1  # Skip the escaped character
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "/":
+            if text.startswith("//", i):
+                # Drop the comment along with its trailing newline
+                chunks.append(text[last:i])
+                newline = text.find("\n", i)
+                last = resume = n if newline == -1 else newline + 1
+        elif ch == ",":
+            j = _skip_json_gap(text, resume)
+            if j < n and text[j] in "}]":
+                chunks.append(text[last:i])
+                last = resume
+        match = search(text, resume)
+    chunks.append(text[last:])
+    return "".join(chunks)
+
+
+def _decode_with_spans(text: str) -> Tuple[Any, Dict[str, Tuple[int, int]]]:
+    """
+    Decodes a JSON document like json.loads. When it is an object, also returns
+    the source span of each top-level value so callers can reuse the raw text.
+    """
+    pos = _JSON_WS_RE.match(text).end()
+    if not text.startswith("{", pos):
+        return _loads(text), {}
+
+    obj: Dict[str, Any] = {}
+    spans: Dict[str, Tuple[int, int]] = {}
+    pos = _JSON_WS_RE.match(text, pos + 1).end()
+    if text.startswith("}", pos):
+        pos += 1
+    else:
+        while True:
+            if not text.startswith('"', pos):
+                raise json.JSONDecodeError(
+                    "Expecting property name enclosed in double quotes", text, pos
+                )
+            key, pos = scanstring(text, pos + 1)
+            pos = _JSON_WS_RE.match(text, pos).end()
+            if not text.startswith(":", pos):
+                raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+            pos = _JSON_WS_RE.match(text, pos + 1).end()
+            value, end = _DECODER.raw_decode(text, pos)
+            obj[key] = value
+            spans[key] = (pos, end)
+            pos = _JSON_WS_RE.match(text, end).end()
+            if text.startswith(",", pos):
+                pos = _JSON_WS_RE.match(text, pos + 1).end()
+            elif text.startswith("}", pos):
+                pos += 1
+                break
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+
+    if _JSON_WS_RE.match(text, pos).end() != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+    return obj, spans
+
+
+def _is_tool_call_dict(parsed: Any) -> bool:
+    """Whether a decoded value has the shape of a tool call"""
+    return (
+        isinstance(parsed, dict)
+        and "name" in parsed
+        and "arguments" in parsed
+        and bool(parsed["name"])
+    )
+
+
+def _parse_tool_call_payload(json_str: str) -> Optional[Tuple[str, str]]:
+    """Parses and validates a JSON tool call into (name, arguments)"""
+    # Payloads that never mention both keys can't be tool calls. Bare words
+    # are matched so that single-quoted keys pass too.
+    if "name" not in json_str or "arguments" not in json_str:
+        return None
+
+    try:
+        # Strip code fences, comments and trailing commas in one pass
+        cleaned = _clean_json(json_str)
+        try:
+            tool_call, spans = _decode_with_spans(cleaned)
+        except json.JSONDecodeError:
+            if "'" not in json_str:
+                raise
+            # Only then treat it as single-quoted JSON and convert the quotes
+            json_str = _SQ_STRING_RE.sub(r'"\1"\2', json_str)
+            cleaned = _clean_json(json_str)
+            tool_call, spans = _decode_with_spans(cleaned)
+        json_str = cleaned
+
+        # Validate structure
+        if not isinstance(tool_call, dict):
+            return None
+
+        # Require both name and arguments fields
+        if "name" not in tool_call or "arguments" not in tool_call:
+            return None
+
+        # Validate name is non-empty string
+        if not isinstance(tool_call["name"], str) or not tool_call["name"].strip():
+            return None
+
+        # Validate arguments is either a dict or string
+        if not isinstance(tool_call["arguments"], (dict, str)):
+            return None
+
+        # Convert to VLLM format, reusing the source text of object arguments
+        arguments = tool_call["arguments"]
+        if isinstance(arguments, dict):
+            start, end = spans["arguments"]
+            arguments = json_str[start:end]
+
+        return tool_call["name"], arguments
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+# The same payload is often seen again by another strategy or request. Only
+# payloads within max_cached_output_len go through this, to bound its memory.
+_parse_tool_call_payload_cached = functools.lru_cache(maxsize=256)(
+    _parse_tool_call_payload
+)
+
 
 @ToolParserManager.register_module("llama33")
 class Llama33ToolParser(ToolParser):
@@ -29,6 +325,17 @@ class Llama33ToolParser(ToolParser):
     Robust tool call parser for Llama3.3 models with multiple fallback methods
     """
 
+    # Parse results shared across instances, since vLLM builds a parser per
+    # request. Keyed on the parser class, its settings and the model output;
+    # outputs longer than max_cached_output_len are never cached.
+    _result_cache: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+    _result_cache_lock = threading.Lock()
+    result_cache_size = 256
+    max_cached_output_len = 16_000
+    # Candidate objects _find_json_in_text may try to decode before giving
+    # up. Objects failing the name/arguments prefilter don't count against it.
+    max_json_candidates = 64
+
     def __init__(self, tokenizer: Any):
         super().__init__(tokenizer)
         self.tokenizer = tokenizer
@@ -49,224 +356,170 @@ class Llama33ToolParser(ToolParser):
 
         Always picks the first valid tool call in the text.
         """
-        candidates = []
-
-        # Special token extraction
-        if self.tool_use_start in model_output and self.tool_use_end in model_output:
-            start_idx = model_output.index(self.tool_use_start) + len(
-                self.tool_use_start
+        # Every supported form carries a JSON object, so plain chat replies
+        # can return straight away without touching the parsers or the cache
+        if "{" not in model_output:
+            return ExtractedToolCallInformation(
+                tools_called=False, tool_calls=[], content=model_output
             )
-            end_idx = model_output.index(self.tool_use_end)
-            json_str = model_output[start_idx:end_idx].strip()
-            tool_calls = self._parse_json_tool_call(json_str)
-            if tool_calls:
-                content = model_output[
-                    : model_output.index(self.tool_use_start)
-                ].strip()
-                candidates.append(
-                    {
-                        "start": model_output.index(self.tool_use_start),
-                        "tool_calls": tool_calls,
-                        "content": content or None,
-                    }
-                )
 
-        # Markdown code block extraction
-        json_block_info = self._extract_json_blocks(model_output)
-        for block_info in json_block_info:
-            tool_calls = self._parse_json_tool_call(block_info["inner_content"])
-            if tool_calls:
-                # Use the start position of the entire markdown block
-                content = model_output[: block_info["block_start"]].strip()
-                candidates.append(
-                    {
-                        "start": block_info["block_start"],
-                        "tool_calls": tool_calls,
-                        "content": content or None,
-                    }
-                )
+        if len(model_output) <= self.max_cached_output_len:
+            found = self._find_tool_call_cached(model_output)
+        else:
+            found = self._find_tool_call(model_output)
 
-        # JSON pattern search
-        json_match = self._find_json_in_text(model_output)
-        if json_match:
-            tool_calls = self._parse_json_tool_call(json_match)
-            if tool_calls:
-                # Find the start position of this JSON match
-                json_start = model_output.find(json_match)
-                if json_start != -1:
-                    content = model_output[:json_start].strip()
-                    candidates.append(
-                        {
-                            "start": json_start,
-                            "tool_calls": tool_calls,
-                            "content": content or None,
-                        }
-                    )
-
-        # If we found any candidates, pick the one with the earliest start position
-        if candidates:
-            # Sort candidates by their start position
-            candidates.sort(key=lambda x: x["start"])
-            earliest = candidates[0]
+        # No tool calls found
+        if found is None:
             return ExtractedToolCallInformation(
-                tools_called=True,
-                tool_calls=earliest["tool_calls"],
-                content=earliest["content"] or None,
+                tools_called=False, tool_calls=[], content=model_output
             )
 
-        # No tool calls found
+        # Tool call ids are generated fresh even when the parse was cached.
+        # name and arguments were checked while parsing, so skip validation.
+        name, arguments, content = found
         return ExtractedToolCallInformation(
-            tools_called=False, tool_calls=[], content=model_output
+            tools_called=True,
+            tool_calls=[
+                ToolCall.model_construct(
+                    id=_next_call_id(),
+                    type="function",
+                    function=FunctionCall.model_construct(
+                        name=name, arguments=arguments
+                    ),
+                )
+            ],
+            content=content,
         )
 
-    def _extract_json_blocks(self, text: str) -> List[Dict[str, Any]]:
-        """Extracts content from markdown code blocks with positions"""
-        pattern = r"```(?:json)?\s*\n(.*?)\n```"
-        matches = re.finditer(pattern, text, re.DOTALL)
-        blocks = []
-        for match in matches:
-            blocks.append(
-                {
-                    "inner_content": match.group(1).strip(),
-                    "block_start": match.start(),
-                    "block_end": match.end(),
-                }
-            )
-        return blocks
+    def _result_cache_settings(self) -> Tuple[Any, ...]:
+        """
+        Settings that change what _find_tool_call returns, used in the result
+        cache key. Subclasses adding such settings should extend this.
+        """
+        return (self.tool_use_start, self.tool_use_end, self.max_json_candidates)
+
+    def _find_tool_call_cached(
+        self, model_output: str
+    ) -> Optional[Tuple[str, str, Optional[str]]]:
+        """Memoized _find_tool_call backed by the class-level LRU cache"""
+        key = (type(self), *self._result_cache_settings(), model_output)
+        cache = Llama33ToolParser._result_cache
+        with self._result_cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+
+        found = self._find_tool_call(model_output)
+        with self._result_cache_lock:
+            cache[key] = found
+            while len(cache) > self.result_cache_size:
+                cache.popitem(last=False)
+        return found
+
+    def _find_tool_call(
+        self, model_output: str
+    ) -> Optional[Tuple[str, str, Optional[str]]]:
+        """
+        Returns (name, arguments, content) for the earliest valid tool call in
+        the output, or None if there isn't one
+        """
+        best = None
+        # Later strategies are skipped when they can't start before this
+        best_start = len(model_output)
 
-    def _find_json_in_text(self, text: str) -> Optional[str]:
-        """Finds first valid JSON object in text"""
-        # First try parsing the entire text as JSON
-        try:
-            parsed = json.loads(text)
-            if isinstance(parsed, dict) and "name" in parsed and "arguments" in parsed:
-                return text
-        except json.JSONDecodeError:
-            pass
+        # Special token extraction
+        head, sep, tail = model_output.partition(self.tool_use_start)
+        if sep:
+            inner, sep, _ = tail.partition(self.tool_use_end)
+            tool_call = self._parse_json_tool_call(inner.strip()) if sep else None
+            if tool_call:
+                best = (*tool_call, head.strip() or None)
+                best_start = len(head)
+
+        # Cheap substring checks let plain chat replies skip the JSON paths
+        first_brace = model_output.find("{")
+        has_brace = first_brace != -1
 
-        # Then look for JSON-like patterns
-        # Use a more robust regex to capture entire JSON objects
-        json_candidates = re.findall(
-            r"\{(?:[^{}]|(?:\{(?:[^{}]|\{[^{}]*\})*\}))*\}", text
-        )
+        # Markdown code block extraction
+        if has_brace and model_output.find("```", 0, best_start) != -1:
+            for block_info in self._extract_json_blocks(model_output):
+                if block_info["block_start"] >= best_start:
+                    break
+                tool_call = self._parse_json_tool_call(block_info["inner_content"])
+                if tool_call:
+                    # Use the start position of the entire markdown block
+                    content = model_output[: block_info["block_start"]].strip()
+                    best = (*tool_call, content or None)
+                    # Later blocks can never start earlier
+                    best_start = block_info["block_start"]
+                    break
 
-        for candidate in json_candidates:
-            # Try parsing without cleaning first
+        # JSON pattern search
+        if has_brace and first_brace < best_start:
+            json_match = self._find_json_in_text(model_output)
+            if json_match and json_match[1] < best_start:
+                json_str, json_start = json_match
+                tool_call = self._parse_json_tool_call(json_str)
+                if tool_call:
+                    content = model_output[:json_start].strip()
+                    best = (*tool_call, content or None)
+
+        return best
+
+    def _extract_json_blocks(self, text: str) -> Iterator[Dict[str, Any]]:
+        """Lazily yields content from markdown code blocks with positions"""
+        if "```" not in text:
+            return
+        for match in _JSON_BLOCK_RE.finditer(text):
+            yield {
+                "inner_content": match.group(1).strip(),
+                "block_start": match.start(),
+                "block_end": match.end(),
+            }
+
+    def _find_json_in_text(self, text: str) -> Optional[Tuple[str, int]]:
+        """Finds first valid JSON object in text along with its start offset"""
+        # First try parsing the entire text as JSON, if it can be an object
+        stripped = text.lstrip()
+        if stripped.startswith("{"):
             try:
-                parsed = json.loads(candidate)
-                if (
-                    isinstance(parsed, dict)
-                    and "name" in parsed
-                    and "arguments" in parsed
-                ):
-                    return candidate
+                parsed = _loads(stripped)
+                if _is_tool_call_dict(parsed):
+                    return stripped, len(text) - len(stripped)
             except json.JSONDecodeError:
-                # If fails, try cleaning common issues
-                cleaned = candidate.strip()
-                cleaned = re.sub(r",\s*(?=[}\]])", "", cleaned)  # Trailing commas
-                cleaned = re.sub(r"//.*?\n", "", cleaned)  # Comments
-
+                pass
+
+        # Then walk brace-balanced objects, stopping at the first tool call.
+        # Objects that aren't tool calls are skipped whole, nested ones included.
+        budget = self.max_json_candidates
+        for i, end in _iter_object_spans(text):
+            # Only objects mentioning both keys are worth decoding
+            if (
+                text.find('"name"', i, end) != -1
+                and text.find('"arguments"', i, end) != -1
+            ):
+                if budget <= 0:
+                    break
+                budget -= 1
+                candidate = text[i:end]
                 try:
-                    parsed = json.loads(cleaned)
-                    if (
-                        isinstance(parsed, dict)
-                        and "name" in parsed
-                        and "arguments" in parsed
-                    ):
-                        return cleaned
+                    parsed = _loads(candidate)
                 except json.JSONDecodeError:
-                    continue
+                    # Only a candidate that fails to decode is cleaned and retried
+                    candidate = _clean_json(candidate)
+                    try:
+                        parsed = _loads(candidate)
+                    except json.JSONDecodeError:
+                        parsed = None
+                if _is_tool_call_dict(parsed):
+                    return candidate, i
         return None
 
-    def _parse_json_tool_call(self, json_str: str) -> List[ToolCall]:
-        """Parses and validates a JSON tool call"""
-        try:
-            # Handle common formatting issues
-            json_str = json_str.strip()
-            json_str = re.sub(r"^\s*```(?:json)?", "", json_str, flags=re.IGNORECASE)
-            json_str = re.sub(r"```\s*$", "", json_str, flags=re.IGNORECASE)
-
-            # Handle single-quoted JSON by converting to double quotes
-            if "'" in json_str:
-                json_str = re.sub(r"'(.*?)':", '"\\1":', json_str)  # Keys
-                json_str = re.sub(r": '(.*?)'", ': "\\1"', json_str)  # Values
-                json_str = re.sub(r"\['(.*?)'\]", '["\\1"]', json_str)  # Array values
-
-            # Remove comments
-            json_str = re.sub(r"//.*?\n", "", json_str)
-
-            # Try parsing without fixing trailing commas
-            tool_call = json.loads(json_str)
-
-            # Validate structure
-            if not isinstance(tool_call, dict):
-                return []
-
-            # Require both name and arguments fields
-            if "name" not in tool_call or "arguments" not in tool_call:
-                return []
-
-            # Validate name is non-empty string
-            if not isinstance(tool_call["name"], str) or not tool_call["name"].strip():
-                return []
-
-            # Validate arguments is either a dict or string
-            if not isinstance(tool_call["arguments"], (dict, str)):
-                return []
-
-            # Convert to VLLM format
-            arguments = tool_call["arguments"]
-            if isinstance(arguments, dict):
-                arguments = json.dumps(arguments)
-
-            return [
-                ToolCall(
-                    id=f"call_{random_tool_call_id()}",
-                    type="function",
-                    function=FunctionCall(name=tool_call["name"], arguments=arguments),
-                )
-            ]
-        except (json.JSONDecodeError, TypeError):
-            # If parsing fails, try fixing trailing commas as a last resort
-            try:
-                json_str = re.sub(r",\s*(?=[}\]])", "", json_str)
-                tool_call = json.loads(json_str)
-
-                # Validate structure
-                if not isinstance(tool_call, dict):
-                    return []
-
-                # Require both name and arguments fields
-                if "name" not in tool_call or "arguments" not in tool_call:
-                    return []
-
-                # Validate name is non-empty string
-                if (
-                    not isinstance(tool_call["name"], str)
-                    or not tool_call["name"].strip()
-                ):
-                    return []
-
-                # Validate arguments is either a dict or string
-                if not isinstance(tool_call["arguments"], (dict, str)):
-                    return []
-
-                # Convert to VLLM format
-                arguments = tool_call["arguments"]
-                if isinstance(arguments, dict):
-                    arguments = json.dumps(arguments)
-
-                return [
-                    ToolCall(
-                        id=f"call_{random_tool_call_id()}",
-                        type="function",
-                        function=FunctionCall(
-                            name=tool_call["name"], arguments=arguments
-                        ),
-                    )
-                ]
-            except (json.JSONDecodeError, TypeError):
-                return []
+    def _parse_json_tool_call(self, json_str: str) -> Optional[Tuple[str, str]]:
+        """Parses and validates a JSON tool call into (name, arguments)"""
+        if len(json_str) <= self.max_cached_output_len:
+            return _parse_tool_call_payload_cached(json_str)
+        return _parse_tool_call_payload(json_str)
 
     # Placeholder for streaming support - not implemented yet
     def extract_tool_calls_streaming(